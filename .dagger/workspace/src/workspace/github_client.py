@@ -0,0 +1,294 @@
+import base64
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from github import Commit, Github, GithubException, InputGitTreeElement
+
+
+class GitHubClient:
+    """Client for interacting with GitHub API for PR reviews and suggestions"""
+
+    def __init__(self, token):
+        """Initialize the GitHub client with an access token"""
+        self.token = token
+        self.github = None  # Will be initialized in async init
+        self.repos = {}  # Repository objects by full name, fetched once
+        self.commits = {}  # Commit objects by (repository, SHA), fetched once
+
+    async def init(self):
+        """Initialize the GitHub client with the token"""
+        token_text = await self.token.plaintext()
+        self.github = Github(token_text)
+        return self
+
+    def get_repo(self, repository: str):
+        """Get a repository object, fetching it from the API only on first use
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+
+        Returns:
+            The cached repository object
+        """
+        if repository not in self.repos:
+            self.repos[repository] = self.github.get_repo(repository)
+        return self.repos[repository]
+
+    def get_commit(self, repository: str, sha: str):
+        """Get a commit object, fetching it from the API only on first use
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+            sha: The commit SHA
+
+        Returns:
+            The cached commit object
+        """
+        key = (repository, sha)
+        if key not in self.commits:
+            self.commits[key] = self.get_repo(repository).get_commit(sha)
+        return self.commits[key]
+
+    async def get_pr_for_commit(self, repo: str, commit: str) -> int:
+        """Get the pull request number associated with a commit"""
+        if not self.github:
+            await self.init()
+        repository = self.get_repo(repo)
+        # Get the PRs associated with this commit from the commit pulls
+        # endpoint instead of scanning the commits of every open PR
+        pulls = [
+            pr for pr in self.get_commit(repo, commit).get_pulls() if pr.state == "open"
+        ]
+        # Other open PRs (e.g. stacked ones) can contain the commit too, so
+        # prefer the PR whose tip it is
+        for pr in pulls:
+            if pr.head.sha == commit:
+                return pr.number
+        if pulls:
+            return pulls[0].number
+        # The association can lag behind a fresh push, so fall back to the
+        # open PRs whose head is this commit; the head SHA is already part of
+        # the listing and needs no extra request per PR
+        for pr in repository.get_pulls(state="open"):
+            if pr.head.sha == commit:
+                return pr.number
+        raise ValueError(f"No pull requests found for commit {commit}")
+
+    async def create_branch_from_pr(
+        self, repository: str, pr_number: int, branch_name: Optional[str] = None
+    ) -> str:
+        """Create a new branch from the head of a PR
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+            pr_number: Pull request number
+            branch_name: Name for the new branch (optional, will generate if not provided)
+
+        Returns:
+            The name of the created branch
+        """
+        if not self.github:
+            await self.init()
+
+        repo = self.get_repo(repository)
+        pr = repo.get_pull(pr_number)
+
+        # Get the head commit SHA
+        head_sha = pr.head.sha
+
+        # Generate a branch name if not provided
+        if not branch_name:
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            branch_name = f"llm-fix-{timestamp}-{str(uuid.uuid4())[:8]}"
+
+        # Create a new branch at the head commit
+        try:
+            repo.create_git_ref(f"refs/heads/{branch_name}", head_sha)
+            print(f"Created branch {branch_name} from PR #{pr_number}")
+            return branch_name
+        except GithubException as e:
+            print(f"Error creating branch: {e}")
+            raise
+
+    async def apply_file_changes(
+        self,
+        repository: str,
+        branch_name: str,
+        file_changes: Dict[str, str],
+        commit_message: str,
+    ) -> str:
+        """Apply changes to files and commit them to a branch
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+            branch_name: Name of the branch to commit to
+            file_changes: Dictionary mapping file paths to their new content
+            commit_message: Commit message
+
+        Returns:
+            The SHA of the created commit
+        """
+        if not self.github:
+            await self.init()
+
+        repo = self.get_repo(repository)
+
+        # Get the reference to the branch
+        ref = repo.get_git_ref(f"refs/heads/{branch_name}")
+
+        # Get the latest commit on the branch
+        latest_commit = repo.get_commit(ref.object.sha)
+        base_tree = latest_commit.commit.tree
+
+        # Create tree elements for each file change
+        tree_elements = []
+        for file_path, content in file_changes.items():
+            try:
+                # Check if file exists
+                existing_content = repo.get_contents(file_path, ref=branch_name)
+                mode = existing_content.mode
+            except GithubException:
+                # File doesn't exist, use default mode for new file
+                mode = "100644"  # Regular file
+
+            # Create a tree element for the file
+            element = InputGitTreeElement(
+                path=file_path, mode=mode, type="blob", content=content
+            )
+            tree_elements.append(element)
+
+        # Create a new tree with the changes
+        new_tree = repo.create_git_tree(tree_elements, base_tree)
+
+        # Create a commit with the new tree
+        parent = repo.get_git_commit(latest_commit.sha)
+        commit = repo.create_git_commit(commit_message, new_tree, [parent])
+
+        # Update the reference to point to the new commit
+        ref.edit(commit.sha)
+
+        print(f"Applied changes to {len(file_changes)} files in branch {branch_name}")
+        return commit.sha
+
+    async def create_pr_from_branch(
+        self, repository: str, base_branch: str, head_branch: str, title: str, body: str
+    ) -> int:
+        """Create a new PR from a branch targeting another branch
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+            base_branch: The target branch for the PR
+            head_branch: The source branch for the PR
+            title: PR title
+            body: PR description
+
+        Returns:
+            The number of the created PR
+        """
+        if not self.github:
+            await self.init()
+
+        repo = self.get_repo(repository)
+
+        # Create the PR
+        pr = repo.create_pull(
+            title=title, body=body, base=base_branch, head=head_branch
+        )
+
+        print(f"Created PR #{pr.number} from {head_branch} to {base_branch}")
+        return pr.number
+
+    async def get_file_content(self, repository: str, file_path: str, ref: str) -> str:
+        """Get the content of a file from a repository
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+            file_path: Path to the file
+            ref: Branch, tag, or commit SHA
+
+        Returns:
+            The content of the file
+        """
+        if not self.github:
+            await self.init()
+
+        repo = self.get_repo(repository)
+
+        try:
+            content = repo.get_contents(file_path, ref=ref)
+            if isinstance(content, list):
+                raise ValueError(f"{file_path} is a directory, not a file")
+
+            # Decode content from base64
+            return base64.b64decode(content.content).decode("utf-8")
+        except GithubException as e:
+            print(f"Error getting file content: {e}")
+            raise
+
+    async def create_review(
+        self,
+        repository: str,
+        pull_number: int,
+        commit: Commit = None,
+        body: str = None,
+        event: str = "COMMENT",
+        comments: List[Dict[str, any]] = None,
+    ) -> None:
+        """Create a review with inline comments on a pull request
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+            pull_number: Pull request number
+            commit: The commit object to review (optional)
+            body: The review body text (optional)
+            event: The review event (e.g., "COMMENT", "APPROVE", "REQUEST_CHANGES"), defaults to "COMMENT"
+            comments: List of review comments with their positions (optional)
+        """
+        if not self.github:
+            await self.init()
+        repo = self.get_repo(repository)
+        pr = repo.get_pull(pull_number)
+
+        # Prepare post parameters
+        post_parameters = {}
+        if body is not None:
+            post_parameters["body"] = body
+        post_parameters["event"] = event
+        if commit is not None:
+            post_parameters["commit"] = commit
+        post_parameters["comments"] = comments if comments is not None else []
+
+        # Create the review with all comments
+        pr.create_review(**post_parameters)
+
+    async def create_review_comment(
+        self,
+        repository: str,
+        pull_number: int,
+        commit,
+        path: str,
+        line: int,
+        body: str,
+    ) -> None:
+        """Create a review comment on a pull request
+
+        Args:
+            repository: Full repository name (e.g., "owner/repo")
+            pull_number: Pull request number
+            commit: The commit object to review
+            path: File path to comment on
+            line: Line number to comment on
+            body: The comment text
+        """
+        if not self.github:
+            await self.init()
+        repo = self.get_repo(repository)
+        pr = repo.get_pull(pull_number)
+
+        # Create the review comment
+        pr.create_review_comment(
+            body=body, commit=commit, path=path, line=line, as_suggestion=True
+        )
+
+        return None
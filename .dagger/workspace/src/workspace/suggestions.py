@@ -0,0 +1,239 @@
+"""Parsing of unified diffs into code suggestions
+
+This module has no Dagger or PyGithub imports and is fully annotated, so the
+parser can be imported on its own and compiled with mypyc
+(``mypyc workspace/suggestions.py``); the compiled extension then takes
+precedence over this file on import without any change to callers.
+"""
+
+import re
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Set
+
+# Diff lines are told apart by their first character; the header patterns
+# are only run on lines that can be headers.
+_FILE_RE = re.compile(r"diff --git a/.*? b/(.*)")
+_HUNK_RE = re.compile(r"@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+# Zero-width split point in front of every file header of a diff
+_FILE_SPLIT_RE = re.compile(r"^(?=diff --git a/[^\r\n]*? b/)", re.MULTILINE)
+
+
+@dataclass(slots=True, frozen=True)
+class CodeSuggestion:
+    """Represents a code suggestion for a specific file and line"""
+
+    file: str
+    line: int
+    suggestion: List[str]
+    position: int  # Position in the diff (relative to the hunk header)
+    diff_hunk: str  # The diff hunk context
+    is_in_diff: bool = False
+
+
+def _make_suggestion(
+    file: str,
+    lines: List[str],
+    line: int,
+    position: int,
+    diff_hunk: List[str],
+    modified_lines: Set[int],
+) -> CodeSuggestion:
+    """Build a suggestion for a block of added lines while the diff is parsed
+
+    Whether the suggestion falls on a modified line is decided here rather
+    than in a separate pass over all suggestions once parsing is done.
+    """
+    suggestion = CodeSuggestion(
+        file=file,
+        line=line,
+        suggestion=lines,
+        position=position,
+        diff_hunk="\n".join(diff_hunk[-10:]),  # Last 10 lines of context
+        is_in_diff=line in modified_lines,
+    )
+    print(
+        f"Suggestion for {suggestion.file}:{suggestion.line} is_in_diff={suggestion.is_in_diff}"
+    )
+    return suggestion
+
+
+def _iter_file_diff(
+    file_diff: str, modified_files: Dict[str, Set[int]]
+) -> Iterator[CodeSuggestion]:
+    """Lazily parse the diff section of a single file into code suggestions
+
+    Args:
+        file_diff: Diff text starting at the file's "diff --git" header
+        modified_files: Maps each file to its modified line numbers, updated in place
+
+    Yields:
+        The suggestions for the file, in diff order
+    """
+    current_file = ""
+    modified_lines: Set[int] = set()  # Modified line numbers of this file
+    current_hunk_start_line = 0
+    position_in_hunk = 0
+    added_lines: List[str] = []
+    added_line_numbers: List[int] = []
+    current_diff_hunk: List[str] = []
+
+    # For tracking line pairs (removed and added)
+    removed_line: Optional[str] = None
+    removed_line_number = 0
+
+    # Walk the lines by index rather than splitting the section into a list
+    n = len(file_diff)
+    end = file_diff.find("\n")
+    if end < 0:
+        end = n
+
+    # The file header only ever starts the section
+    file_match = _FILE_RE.match(file_diff[:end].rstrip("\r"))
+    if file_match:
+        # Every suggestion and the modified_files key share one interned path
+        current_file = sys.intern(file_match.group(1))
+        modified_lines = modified_files.setdefault(current_file, set())
+
+    i = end + 1
+    while i < n:
+        end = file_diff.find("\n", i)
+        if end < 0:
+            end = n
+        line = file_diff[i:end]
+        i = end + 1
+        if line[-1:] == "\r":  # Lines of files with CRLF endings
+            line = line[:-1]
+        first = line[:1]
+
+        # Check for hunk header
+        hunk_match = _HUNK_RE.match(line) if first == "@" else None
+        if hunk_match:
+            # Process any pending suggestions before moving to a new hunk
+            if added_lines and current_file and current_diff_hunk:
+                yield _make_suggestion(
+                    current_file,
+                    added_lines,
+                    added_line_numbers[0],  # Use the first line number
+                    position_in_hunk,
+                    current_diff_hunk,
+                    modified_lines,
+                )
+                added_lines = []
+                added_line_numbers = []
+
+            # Get both the original and new line numbers from the hunk header
+            original_start = int(hunk_match.group(1))
+            new_start = int(hunk_match.group(2))
+
+            current_hunk_start_line = new_start - 1  # 0-based for internal tracking
+            position_in_hunk = 1  # Reset position counter for new hunk
+            current_diff_hunk = [line]  # Start collecting the hunk
+            removed_line = None
+            removed_line_number = original_start - 1  # 0-based for internal tracking
+            continue
+
+        # Collect the diff hunk
+        if current_diff_hunk:
+            current_diff_hunk.append(line)
+
+        is_added = first == "+" and not line.startswith("+++")
+
+        # Track position for each line after a hunk header
+        if position_in_hunk > 0:
+            position_in_hunk += 1
+
+        # Track modified lines with better handling of line pairs
+        if current_file and position_in_hunk > 0:
+            if first == "-" and not line.startswith("---"):
+                # This is a removed line - store it for potential pairing
+                removed_line = line[1:]  # Remove the '-' prefix
+                removed_line_number += 1
+            elif is_added:
+                # This is an added line
+                current_line_number = current_hunk_start_line + 1
+
+                # Mark this line as modified
+                modified_lines.add(current_line_number)
+
+                # If we have a removed line right before this, it's likely a modification
+                # rather than a pure addition
+                if removed_line is not None:
+                    # This is a modified line (replacement)
+                    # We've already marked it as modified above
+                    removed_line = None  # Reset for next pair
+
+                current_hunk_start_line += 1
+            else:
+                # This is a context line
+                if first != "\\":  # Ignore "\ No newline at end of file"
+                    current_hunk_start_line += 1
+                    removed_line_number += 1
+                    removed_line = None  # Reset removed line tracking
+
+        # Collect added lines (additions)
+        if is_added:
+            # Skip the + prefix
+            content = line[1:]
+            # Only collect meaningful additions (not just whitespace changes)
+            if content.strip():
+                if not added_lines:
+                    # This is the first line of a new addition
+                    line_number = current_hunk_start_line
+                    added_line_numbers.append(line_number)
+                added_lines.append(content)
+        elif added_lines and current_file and current_diff_hunk:
+            # We've reached the end of a block of additions
+            # Create a suggestion for the accumulated added lines
+            yield _make_suggestion(
+                current_file,
+                added_lines,
+                added_line_numbers[0],  # Use the first line number
+                position_in_hunk
+                - len(added_lines),  # Adjust position to start of block
+                current_diff_hunk,
+                modified_lines,
+            )
+            added_lines = []
+            added_line_numbers = []
+
+    # Handle any remaining added lines at the end of the file
+    if added_lines and current_file and current_diff_hunk:
+        yield _make_suggestion(
+            current_file,
+            added_lines,
+            added_line_numbers[0],
+            position_in_hunk - len(added_lines) + 1,
+            current_diff_hunk,
+            modified_lines,
+        )
+
+
+def iter_unified_diff(diff_text: str) -> Iterator[CodeSuggestion]:
+    """Lazily parse a unified diff format text into code suggestions
+
+    Suggestions are yielded as soon as their block of added lines ends, so
+    callers that consume them once never hold the full list.
+    """
+    # Keep track of which lines were actually modified in the diff
+    modified_files: Dict[str, Set[int]] = {}  # file -> set of modified line numbers
+
+    # For debugging
+    print(f"Parsing diff of length {len(diff_text)}")
+
+    # Split the diff once into per-file sections and parse each on its own
+    for file_diff in _FILE_SPLIT_RE.split(diff_text):
+        # Skip text before the first file header and sections without any
+        # hunks (binary files, pure renames and mode changes)
+        if not file_diff.startswith("diff --git ") or "\n@@ -" not in file_diff:
+            continue
+        yield from _iter_file_diff(file_diff, modified_files)
+
+    # Print the modified files and lines for debugging
+    for file, lines in modified_files.items():
+        print(f"Modified file: {file}, lines: {sorted(lines)}")
+
+
+def parse_unified_diff(diff_text: str) -> List[CodeSuggestion]:
+    """Parse a unified diff format text into code suggestions"""
+    return list(iter_unified_diff(diff_text))